@@ -0,0 +1,401 @@
+"""
+Асинхронное ядро менеджера буфера - общее для Tk и веб-версии
+
+Один цикл asyncio: опрос буфера, горячие клавиши, отложенное сохранение
+и быстрая вставка. Блокирующие вызовы (pyperclip, запись файла, эмуляция
+Ctrl+V) уходят в маленький пул потоков. Интерфейсы наследуют ClipboardCore,
+добавляют свои задачи через ui_tasks и обрабатывают клавиши в
+on_key_press/on_key_release.
+
+При запуске первыми поднимаются горячие клавиши и захват буфера, история
+читается в фоне.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clipboard_store import HistoryStore
+
+# Тяжелые модули импортируются при первом использовании:
+# pynput - в setup_hotkeys, pyperclip - перед первым опросом буфера
+keyboard = None
+pyperclip = None
+
+def import_keyboard():
+    """Импортируем pynput"""
+    global keyboard
+    from pynput import keyboard
+
+def import_clipboard():
+    """Импортируем pyperclip"""
+    global pyperclip
+    import pyperclip
+
+class ClipboardCore:
+    def __init__(self):
+        # История, закрепленные записи и архив
+        self.store = HistoryStore(os.path.join(os.path.dirname(__file__), 'clipboard_history.json'),
+                                  os.path.join(os.path.dirname(__file__), 'clipboard_archive'))
+        self.quick_slots = 9  # Ctrl+Alt+1..9
+        self.quick_paste_autopaste = False  # Сразу вставлять (Ctrl+V) после быстрого копирования
+        self.pending_paste = False  # Ждем отпускания Alt чтобы вставить
+        self.synthesizing = False  # Идет synthesize_paste - слушатель видит наши же нажатия
+        self.last_clipboard = ""
+        self.clipboard_generation = 0  # Растет при каждом нашем copy - отбрасываем устаревшие чтения
+        self.running = True
+        self.keys_pressed = set()
+        self.window_visible = False
+        
+        # Цикл asyncio и его примитивы создаются в run()
+        self.loop = None
+        self.core_ready = threading.Event()  # Горячие клавиши и захват поднялись (или упали)
+        self.executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='buffalo-io')
+        self.tasks = []
+        self.key_listener = None
+        self.hotkey_events = None  # Очередь событий клавиатуры из потока pynput
+        self.save_requested = None  # Событие "есть несохраненные изменения"
+        self.history_ready = None  # История прочитана с диска
+        self.stopped = None
+        self.poll_interval = 0.3  # Период опроса буфера
+        self.save_delay = 0.5  # Склеиваем серию изменений в одну запись на диск
+        self.max_pending_hotkeys = 64  # Больше - значит цикл не успевает, лишнее отбрасываем
+        self.started_at = time.perf_counter()  # Интерфейс подставляет момент старта процесса
+        self.measure_startup = False  # --measure-startup: замерить запуск и выйти
+        self.startup_marks = {}  # Этап запуска -> секунды от старта процесса
+        self.startup_failures = {}  # Этап запуска -> ошибка, с которой он не поднялся
+        self.startup_stages = {
+            'hotkeys': 'Горячие клавиши',
+            'capture': 'Первый захват буфера',
+            'history': 'Загрузка истории',
+        }
+        self.startup_error = None  # Почему запуск пришлось остановить (слушатель клавиш, импорт pyperclip)
+
+    async def run(self):
+        """Главный цикл: все задачи менеджера в одном event loop"""
+        self.loop = asyncio.get_running_loop()
+        self.hotkey_events = asyncio.Queue(maxsize=self.max_pending_hotkeys)
+        self.save_requested = asyncio.Event()
+        self.history_ready = asyncio.Event()
+        self.stopped = asyncio.Event()
+        
+        # Сначала горячие клавиши и захват, история и интерфейс - следом в фоне
+        self.tasks = [
+            asyncio.create_task(self.handle_hotkeys()),
+            self.startup_task(self.start_hotkeys(), 'hotkeys'),
+            self.startup_task(self.monitor_clipboard(), 'capture'),
+            asyncio.create_task(self.load_history()),
+            asyncio.create_task(self.persist_history()),
+        ]
+        self.tasks += [asyncio.create_task(coro) for coro in self.ui_tasks()]
+        
+        try:
+            await self.stopped.wait()
+        finally:
+            self.running = False
+            self.core_ready.set()  # Не держим ждущих запуска, если остановились раньше
+            if self.key_listener:
+                self.key_listener.stop()
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            # Ждем запись, начатую в пуле, и досохраняем то, что не успел отложенный save
+            self.executor.shutdown(wait=True)
+            if self.save_requested.is_set() and self.history_ready.is_set():
+                self.write_state(self.snapshot(), self.store.take_archive_changes())
+
+    def ui_tasks(self):
+        """Корутины интерфейса, которые run запускает вместе с ядром"""
+        return []
+
+    def request_stop(self):
+        """Останавливаем цикл изнутри (в потоке цикла)"""
+        self.running = False
+        self.stopped.set()
+
+    def startup_task(self, coro, stage):
+        """Задача, без которой менеджер бесполезен: ее падение останавливает все"""
+        task = asyncio.create_task(coro)
+        task.add_done_callback(lambda task: self.startup_task_done(task, stage))
+        return task
+
+    def startup_task_done(self, task, stage):
+        """Задача запуска завершилась - если с ошибкой, сообщаем и останавливаемся"""
+        if task.cancelled() or task.exception() is None:
+            return
+        self.startup_error = task.exception()
+        self.startup_failures[stage] = self.startup_error
+        print(f"💥 {self.startup_stages[stage]}: {self.startup_error}")
+        if self.measure_startup:
+            self.report_startup()
+        self.request_stop()
+
+    def mark_startup(self, stage, error=None):
+        """Запоминаем, когда этап запуска стал готов (или первая попытка упала с error)"""
+        if stage in self.startup_marks or stage in self.startup_failures:
+            return
+        if error is None:
+            self.startup_marks[stage] = time.perf_counter() - self.started_at
+        else:
+            self.startup_failures[stage] = error
+        finished = self.startup_marks.keys() | self.startup_failures.keys()
+        if {'hotkeys', 'capture'} <= finished:
+            self.core_ready.set()
+        if self.measure_startup and len(finished) == len(self.startup_stages):
+            self.report_startup()
+            self.request_stop()
+
+    def report_startup(self):
+        """Печатаем замер запуска: время готовых этапов и этапы, которые упали"""
+        for stage, title in self.startup_stages.items():
+            if stage in self.startup_marks:
+                print(f"⏱️ {title}: {self.startup_marks[stage] * 1000:.0f} мс")
+            elif stage in self.startup_failures:
+                print(f"❌ {title}: не запустились ({self.startup_failures[stage]})")
+
+    async def load_history(self):
+        """Загружаем историю из файла в фоне"""
+        try:
+            data = await self.loop.run_in_executor(self.executor, self.store.read_file)
+            
+            # Что успели скопировать и закрепить, пока читали файл, остается сверху
+            changed = self.store.load(data)
+            self.load_settings(data)
+            print(f"📚 Загружено {len(self.store.entries_by_text)} записей из истории")
+            if changed:
+                self.request_save()
+        except Exception as e:
+            print(f"⚠️ Ошибка загрузки истории: {e}")
+        finally:
+            self.history_ready.set()
+            self.mark_startup('history')
+
+    def load_settings(self, data):
+        """Настройки менеджера из прочитанного файла истории"""
+        self.quick_paste_autopaste = data.get('quick_paste_autopaste', False)
+
+    def snapshot(self):
+        """Снимок состояния для записи на диск (делается в потоке цикла)"""
+        return dict(self.store.snapshot(), quick_paste_autopaste=self.quick_paste_autopaste)
+
+    def write_state(self, data, archive_changes):
+        """Пишем на диск изменения архива, затем историю (в пуле потоков)
+        
+        Возвращает тексты, вычищенные из архива (см. HistoryStore.write_archive).
+        """
+        purged = self.store.write_archive(archive_changes)
+        self.store.save_file(data)
+        return purged
+
+    def save_history(self):
+        """Сохраняем историю в файл"""
+        self.store.save_file(self.snapshot())
+
+    def request_save(self):
+        """Помечаем историю грязной - запишет persist_history"""
+        if self.measure_startup:
+            return  # Замер запуска не трогает файл истории
+        if self.save_requested is None:
+            self.save_history()  # Цикл еще не запущен
+        else:
+            self.save_requested.set()
+
+    async def persist_history(self):
+        """Отложенное сохранение: одна запись на серию изменений"""
+        # Пока файл не прочитан, не перезаписываем его неполной историей
+        await self.history_ready.wait()
+        while self.running:
+            await self.save_requested.wait()
+            await asyncio.sleep(self.save_delay)
+            self.save_requested.clear()
+            # Пишем в пуле - снимок уже сделан, дальше цикл не ждет диск
+            purged = await self.loop.run_in_executor(self.executor, self.write_state, self.snapshot(),
+                                                     self.store.take_archive_changes())
+            self.store.forget_deleted(purged)
+
+    async def monitor_clipboard(self):
+        """Мониторинг изменений буфера обмена"""
+        await self.loop.run_in_executor(self.executor, import_clipboard)
+        while self.running:
+            try:
+                generation = self.clipboard_generation
+                current_clipboard = await self.loop.run_in_executor(self.executor, pyperclip.paste)
+                self.mark_startup('capture')
+                
+                # Пока читали, мы сами положили что-то в буфер - чтение устарело
+                if (generation == self.clipboard_generation and
+                    current_clipboard != self.last_clipboard and
+                    current_clipboard.strip() and
+                    len(current_clipboard.strip()) > 1):
+                    
+                    self.add_to_history(current_clipboard)
+                    self.last_clipboard = current_clipboard
+            
+            except Exception as e:
+                print(f"⚠️ Ошибка мониторинга: {e}")
+                # Буфер недоступен (нет xclip/xsel, X еще стартует) - запуск не ждет,
+                # опрос продолжается и подхватит буфер, когда тот заработает
+                self.mark_startup('capture', error=e)
+            
+            await asyncio.sleep(self.poll_interval)
+
+    def add_to_history(self, text):
+        """Добавляем текст в историю"""
+        # Фильтруем специальные символы и проверяем длину
+        try:
+            clean_text = text.encode('utf-8', errors='replace').decode('utf-8')
+            # Игнорируем короткие записи и длинные (больше 50 символов)
+            if len(clean_text.strip()) < 2 or len(clean_text.strip()) > 50:
+                return
+        except:
+            return  # Игнорируем проблемные тексты
+        
+        # Добавляем в начало (дубликат уходит, лишнее вытесняется в архив)
+        entry = self.store.add(clean_text)
+        
+        self.request_save()
+        
+        print(f"📋 Добавлено: {entry['preview']}")
+
+    async def search_history(self, text, cursor=None, limit=20, since=None, until=None):
+        """Поиск в истории и в архиве (архив читается в пуле потоков)"""
+        archived = []
+        while self.store.archive_evicted:
+            # Архив переписали, пока искали - удаленное могло уже забыться в deleted_at
+            version = self.store.archive_version
+            archived = await self.loop.run_in_executor(self.executor, self.store.search_archive,
+                                                       text.lower(), since, until)
+            if version == self.store.archive_version:
+                break
+        return self.store.search_history(text, cursor, limit, since, until, archived)
+
+    async def start_hotkeys(self):
+        """Поднимаем слушатель клавиатуры в пуле и ждем его готовности"""
+        await self.loop.run_in_executor(self.executor, self.setup_hotkeys)
+        self.mark_startup('hotkeys')
+
+    def setup_hotkeys(self):
+        """Настройка горячих клавиш"""
+        import_keyboard()
+        
+        # Поток pynput только пересылает события в цикл, состояние не трогает.
+        # Свои нажатия из synthesize_paste пропускаем: injected дает pynput 1.8+,
+        # флаг synthesizing - на случай версий постарше
+        def on_press(key, injected=False):
+            if not (injected or self.synthesizing):
+                self.loop.call_soon_threadsafe(self.post_hotkey, ('press', key, time.time()))
+        
+        def on_release(key, injected=False):
+            if not (injected or self.synthesizing):
+                self.loop.call_soon_threadsafe(self.post_hotkey, ('release', key, time.time()))
+        
+        self.key_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
+        self.key_listener.start()
+        self.key_listener.wait()
+
+    def post_hotkey(self, event):
+        """Кладем событие в очередь (в потоке цикла)"""
+        try:
+            self.hotkey_events.put_nowait(event)
+        except asyncio.QueueFull:
+            print("⚠️ Очередь клавиш переполнена, событие пропущено")
+
+    async def handle_hotkeys(self):
+        """Обрабатываем события клавиатуры по одному"""
+        while self.running:
+            kind, key, pressed_at = await self.hotkey_events.get()
+            try:
+                if kind == 'press':
+                    await self.on_key_press(key, pressed_at)
+                else:
+                    await self.on_key_release(key)
+            except Exception as e:
+                # Одна неудачная клавиша (ошибка окна, вставки) не должна убить обработчик
+                print(f"⚠️ Ошибка обработки клавиши: {e}")
+
+    async def on_key_press(self, key, pressed_at):
+        """Нажатие клавиши (pressed_at - время самого нажатия, а не обработки)"""
+
+    async def on_key_release(self, key):
+        """Отпускание клавиши"""
+
+    def quick_slot(self, key):
+        """Номер слота 1..9 для цифровой клавиши (или None)"""
+        char = getattr(key, 'char', None)
+        if char and char in '123456789':
+            return int(char)
+        # С зажатыми Ctrl+Alt char часто пустой - смотрим на код клавиши
+        vk = getattr(key, 'vk', None)
+        if vk is not None and ord('1') <= vk <= ord('9'):
+            return vk - ord('0')
+        return None
+
+    def get_quick_entries(self):
+        """Записи для быстрой вставки: сначала закрепленные, потом последние"""
+        return self.store.quick_entries(self.quick_slots)
+
+    async def copy_text(self, text, keep_order=True):
+        """Кладем текст в буфер через пул потоков
+        
+        keep_order=True - не поднимать запись наверх истории при следующем опросе.
+        """
+        self.clipboard_generation += 1
+        if keep_order:
+            self.last_clipboard = text
+            # Запись не переподнимется опросом - считаем использование здесь
+            if self.store.touch(text):
+                self.request_save()
+        await self.loop.run_in_executor(self.executor, pyperclip.copy, text)
+
+    async def quick_paste(self, slot):
+        """Кладем N-ю запись в буфер, окно не трогаем"""
+        await self.history_ready.wait()
+        entries = self.get_quick_entries()
+        if slot > len(entries):
+            return
+        text = entries[slot - 1]['text']
+        try:
+            # Не поднимаем запись наверх истории - иначе номера слотов поплывут
+            await self.copy_text(text)
+            print(f"⚡ Слот {slot}: {text[:50]}")
+        except Exception as e:
+            print(f"⚠️ Ошибка быстрой вставки: {e}")
+            return
+        if self.quick_paste_autopaste:
+            self.pending_paste = True
+
+    def synthesize_paste(self):
+        """Нажимаем Ctrl+V за пользователя (в пуле потоков)"""
+        # Иначе синтетический Ctrl собьет keys_pressed и двойной Ctrl
+        self.synthesizing = True
+        try:
+            controller = keyboard.Controller()
+            with controller.pressed(keyboard.Key.ctrl):
+                controller.press('v')
+                controller.release('v')
+        except Exception as e:
+            print(f"⚠️ Ошибка вставки: {e}")
+        finally:
+            self.synthesizing = False
+
+    def toggle_pin(self, text):
+        """Закрепляем/открепляем запись"""
+        if self.store.toggle_pin(text):
+            print(f"📌 Закреплено: {text[:30]}...")
+        else:
+            print(f"📍 Откреплено: {text[:30]}...")
+        self.request_save()
+
+    def clear_history(self):
+        """Очищаем всю историю (закрепленные записи остаются)"""
+        self.store.clear()
+        self.request_save()
+        print("🗑️ История очищена")
+
+    def delete_entry(self, text):
+        """Удаляем конкретную запись"""
+        self.store.delete(text)
+        self.request_save()
+        print(f"🗑️ Удалено: {text[:30]}...")
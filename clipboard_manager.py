@@ -2,177 +2,192 @@
 """
 Менеджер буфера обмена с историей
 Горячие клавиши: Ctrl+Shift+V - показать/скрыть историю, Ctrl+X - выход
+Ctrl+Alt+1..9 - вставить N-ю закрепленную/последнюю запись без окна
+
+Все работает в одном цикле asyncio (ядро - clipboard_core.py): опрос буфера,
+горячие клавиши, отложенное сохранение и отрисовка Tk.
+
+При запуске первыми поднимаются горячие клавиши и захват буфера, история
+читается в фоне, Tk импортируется и создает окно уже после них.
+--measure-startup - замерить время запуска и выйти.
 """
 
-import tkinter as tk
-from tkinter import ttk
-import pyperclip
-import threading
 import time
-from datetime import datetime
-from pynput import keyboard
-import json
-import os
 
-class ClipboardManager:
+STARTED_AT = time.perf_counter()  # Отсчет для --measure-startup
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+import clipboard_core as core
+
+# tkinter импортируется при первом показе окна (pynput и pyperclip - в ядре)
+tk = None
+ttk = None
+
+def import_tk():
+    """Импортируем tkinter"""
+    global tk, ttk
+    import tkinter as tk
+    from tkinter import ttk
+
+class ClipboardManager(core.ClipboardCore):
     def __init__(self, root=None):
+        super().__init__()
+        self.started_at = STARTED_AT
         self.root = root
-        self.history = []
-        self.max_history = 50
-        self.last_clipboard = ""
-        self.running = True
         self.window = None
-        self.data_file = os.path.join(os.path.dirname(__file__), 'clipboard_history.json')
-        self.keys_pressed = set()
-        self.window_visible = False
-        self.clipboard_lock = threading.Lock()
-        self.save_lock = threading.Lock()
         self.last_ctrl_press = 0  # Время последнего нажатия Ctrl
         self.history_scrollable = None  # Контейнер для карточек
         self.window_width = 560  # Ширина окна по умолчанию
         self.window_height = None  # Высота окна (90% экрана)
+        self.page_size = 30  # Карточек за одну подгрузку
+        self.page_cursor = None  # Курсор следующей страницы (None - все показано)
+        self.time_filter = 'all'
+        self.time_filters = {
+            'all': 'Всё время',
+            'hour': 'Последний час',
+            'today': 'Сегодня',
+            'yesterday': 'Вчера',
+        }
+        self.count_label = None
+        self.search_text = ''  # Непустой - в окне результаты поиска (с архивом)
+        self.search_generation = 0  # Отбрасываем ответы поиска, устаревшие до прихода
+        self.search_after_id = None
         
-        # Загружаем историю
-        self.load_history()
-        
-        # Запускаем мониторинг буфера в фоне
-        self.monitor_thread = threading.Thread(target=self.monitor_clipboard, daemon=True)
-        self.monitor_thread.start()
-        
-        # Настраиваем горячие клавиши
-        self.setup_hotkeys()
+        # Отрисовка Tk внутри цикла ядра
+        self.ui_frame_interval = 1 / 60  # Период обработки событий Tk, пока окно открыто
+        self.ui_idle_interval = 1.0  # ...и пока скрыто (демону незачем просыпаться чаще)
+        self.ui_wakeup = None  # Будит pump_tk при показе окна
+        self.ui_warmup_delay = 2.0  # Через сколько после запуска заранее построить окно
         
         print("🦬 Buffalo запущен!")
         print("🔥 Двойной Ctrl - показать/скрыть Buffalo")
         print("🔥 Esc - скрыть окно")
         print("🛑 Остановка: sudo supervisorctl stop clipboard-manager")
-        print(f"📚 Загружено {len(self.history)} записей")
 
-    def load_history(self):
-        """Загружаем историю из файла"""
-        try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.history = data.get('history', [])
-                    self.window_width = data.get('window_width', 560)
-                    print(f"📚 Загружено {len(self.history)} записей из истории")
-        except Exception as e:
-            print(f"⚠️ Ошибка загрузки истории: {e}")
+    def ui_tasks(self):
+        """Насос Tk, если корневое окно уже есть, иначе - заготовка окна"""
+        self.ui_wakeup = asyncio.Event()
+        if self.root:
+            return [self.pump_tk()]
+        if not self.measure_startup:
+            return [self.warm_up_ui()]
+        return []
 
-    def save_history(self):
-        """Сохраняем историю в файл"""
-        with self.save_lock:
-            try:
-                # Атомарная запись через временный файл
-                temp_file = self.data_file + '.tmp'
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        'history': self.history,
-                        'window_width': self.window_width
-                    }, f, ensure_ascii=False, indent=2)
-                
-                # Атомарное переименование
-                os.replace(temp_file, self.data_file)
-            except Exception as e:
-                print(f"⚠️ Ошибка сохранения истории: {e}")
-                # Удаляем поврежденный временный файл
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-
-    def monitor_clipboard(self):
-        """Мониторинг изменений буфера обмена"""
-        while self.running:
-            try:
-                current_clipboard = pyperclip.paste()
-                
-                # Проверяем изменения с блокировкой от race condition
-                with self.clipboard_lock:
-                    if (current_clipboard != self.last_clipboard and 
-                        current_clipboard.strip() and 
-                        len(current_clipboard.strip()) > 1):
-                        
-                        self.add_to_history(current_clipboard)
-                        self.last_clipboard = current_clipboard
-                    
-            except Exception as e:
-                print(f"⚠️ Ошибка мониторинга: {e}")
-            
-            time.sleep(0.3)  # Уменьшил интервал для лучшей отзывчивости
+    async def load_history(self):
+        """Загружаем историю из файла в фоне"""
+        await super().load_history()
+        # Окно могли открыть раньше, чем дочитали файл
+        if self.window_visible:
+            self.refresh_history()
 
-    def add_to_history(self, text):
-        """Добавляем текст в историю"""
-        # Фильтруем специальные символы и проверяем длину
-        try:
-            clean_text = text.encode('utf-8', errors='replace').decode('utf-8')
-            # Игнорируем короткие записи и длинные (больше 50 символов)
-            if len(clean_text.strip()) < 2 or len(clean_text.strip()) > 50:
-                return
-        except:
-            return  # Игнорируем проблемные тексты
-        
-        # Убираем дубликаты
-        self.history = [item for item in self.history if item['text'] != clean_text]
-        
-        # Добавляем новую запись в начало
-        entry = {
-            'text': clean_text,
-            'timestamp': datetime.now().isoformat(),
-            'preview': clean_text[:80] + ('...' if len(clean_text) > 80 else '')
-        }
-        
-        self.history.insert(0, entry)
-        
-        # Ограничиваем размер истории
-        if len(self.history) > self.max_history:
-            self.history = self.history[:self.max_history]
-        
-        # Сохраняем в главном потоке через root.after
-        if self.root:
-            self.root.after(0, self.save_history)
-        else:
-            self.save_history()
-        
-        print(f"📋 Добавлено: {entry['preview']}")
+    def load_settings(self, data):
+        """Настройки менеджера и окна из файла истории"""
+        super().load_settings(data)
+        self.window_width = data.get('window_width', 560)
 
-    def setup_hotkeys(self):
-        """Настройка горячих клавиш"""
-        def on_press(key):
-            try:
-                if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
-                    # Проверяем двойное нажатие Ctrl
-                    current_time = time.time()
-                    if current_time - self.last_ctrl_press < 0.4:  # 400мс
-                        # Двойной Ctrl - toggle окна
-                        self.show_history_window()
-                        self.last_ctrl_press = 0  # Сбрасываем
-                    else:
-                        self.last_ctrl_press = current_time
-                    self.keys_pressed.add('ctrl')
-                elif key == keyboard.Key.shift_l or key == keyboard.Key.shift_r:
-                    self.keys_pressed.add('shift')
-                elif key == keyboard.Key.esc:
-                    # Esc - скрыть окно (если открыто)
-                    if self.window_visible:
-                        self.show_history_window()  # toggle закроет
-                        
-            except AttributeError:
-                pass
+    def snapshot(self):
+        """Снимок состояния для записи на диск (делается в потоке цикла)"""
+        return dict(super().snapshot(), window_width=self.window_width)
+
+    def time_range(self, name):
+        """Границы фильтра по времени (since, until) в unix-времени"""
+        now = datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if name == 'hour':
+            return (now - timedelta(hours=1)).timestamp(), None
+        if name == 'today':
+            return midnight.timestamp(), None
+        if name == 'yesterday':
+            return (midnight - timedelta(days=1)).timestamp(), midnight.timestamp()
+        return None, None
+
+    async def on_key_press(self, key, pressed_at):
+        """Нажатие клавиши"""
+        Key = core.keyboard.Key
+        if key == Key.ctrl_l or key == Key.ctrl_r:
+            # Проверяем двойное нажатие Ctrl (по времени самого нажатия, а не обработки)
+            if pressed_at - self.last_ctrl_press < 0.4:  # 400мс
+                # Двойной Ctrl - toggle окна
+                self.show_history_window()
+                self.last_ctrl_press = 0  # Сбрасываем
+            else:
+                self.last_ctrl_press = pressed_at
+            self.keys_pressed.add('ctrl')
+        elif key == Key.shift_l or key == Key.shift_r:
+            self.keys_pressed.add('shift')
+        elif key in (Key.alt_l, Key.alt_r, Key.alt_gr):
+            self.keys_pressed.add('alt')
+        elif {'ctrl', 'alt'} <= self.keys_pressed and self.quick_slot(key):
+            # Ctrl+Alt+N - быстрая вставка без окна
+            self.last_ctrl_press = 0  # Не путаем с двойным Ctrl
+            await self.quick_paste(self.quick_slot(key))
+        elif key == Key.esc:
+            # Esc - скрыть окно (если открыто)
+            if self.window_visible:
+                self.show_history_window()  # toggle закроет
+
+    async def on_key_release(self, key):
+        """Отпускание клавиши"""
+        Key = core.keyboard.Key
+        if key == Key.ctrl_l or key == Key.ctrl_r:
+            self.keys_pressed.discard('ctrl')
+        elif key == Key.shift_l or key == Key.shift_r:
+            self.keys_pressed.discard('shift')
+        elif key in (Key.alt_l, Key.alt_r, Key.alt_gr):
+            self.keys_pressed.discard('alt')
+            # Вставляем только после отпускания Alt, иначе уйдет Ctrl+Alt+V
+            if self.pending_paste:
+                self.pending_paste = False
+                await self.loop.run_in_executor(self.executor, self.synthesize_paste)
 
-        def on_release(key):
+    def toggle_pin(self, text):
+        """Закрепляем/открепляем запись"""
+        super().toggle_pin(text)
+        self.refresh_history()
+
+    def ensure_root(self):
+        """Создаем скрытое корневое окно Tk при первой необходимости"""
+        if self.root is not None:
+            return
+        import_tk()
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.root.protocol("WM_DELETE_WINDOW", self.stop)
+        self.tasks.append(self.loop.create_task(self.pump_tk()))
+
+    async def warm_up_ui(self):
+        """Заранее строим скрытое окно, когда запуск уже закончен"""
+        await self.history_ready.wait()
+        await asyncio.sleep(self.ui_warmup_delay)
+        if not self.window:
+            self.ensure_root()
+            self.create_history_window()
+
+    async def pump_tk(self):
+        """Обрабатываем события Tk внутри цикла asyncio вместо mainloop
+
+        Открытое окно - с частотой кадров, скрытое - раз в ui_idle_interval;
+        показ окна будит насос сразу через ui_wakeup.
+        """
+        while self.running:
+            try:
+                self.root.update()
+            except tk.TclError:
+                # Корневое окно уничтожено
+                self.stop()
+                return
+            if self.window_visible:
+                await asyncio.sleep(self.ui_frame_interval)
+                continue
+            self.ui_wakeup.clear()
             try:
-                if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
-                    self.keys_pressed.discard('ctrl')
-                elif key == keyboard.Key.shift_l or key == keyboard.Key.shift_r:
-                    self.keys_pressed.discard('shift')
-            except AttributeError:
+                await asyncio.wait_for(self.ui_wakeup.wait(), self.ui_idle_interval)
+            except asyncio.TimeoutError:
                 pass
 
-        self.key_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
-        self.key_listener.start()
-
     def show_history_window(self):
         """Показываем окно с историей"""
         # Если окно уже открыто - прячем его (toggle)
@@ -181,6 +196,7 @@ class ClipboardManager:
             return
             
         self.window_visible = True
+        self.ensure_root()
         
         # Если окно не создано - создаем
         if not self.window or not self.window.winfo_exists():
@@ -191,6 +207,7 @@ class ClipboardManager:
         
         # Показываем окно
         self.window.deiconify()
+        self.ui_wakeup.set()
         
         # Прижимаем к левому краю ПОСЛЕ показа
         screen_height = self.window.winfo_screenheight()
@@ -208,10 +225,8 @@ class ClipboardManager:
             self.window_visible = False
 
     def clear_history(self):
-        """Очищаем всю историю"""
-        self.history = []
-        self.save_history()
-        print("🗑️ История очищена")
+        """Очищаем всю историю (закрепленные записи остаются)"""
+        super().clear_history()
         # Уничтожаем окно
         if self.window and self.window.winfo_exists():
             self.window.destroy()
@@ -232,9 +247,7 @@ class ClipboardManager:
 
     def delete_entry(self, text):
         """Удаляем конкретную запись"""
-        self.history = [item for item in self.history if item['text'] != text]
-        self.save_history()
-        print(f"🗑️ Удалено: {text[:30]}...")
+        super().delete_entry(text)
         # Обновляем содержимое окна
         self.refresh_history()
 
@@ -268,7 +281,7 @@ class ClipboardManager:
         def on_window_resize(event):
             if event.widget == self.window:
                 self.window_width = event.width
-                self.save_history()
+                self.request_save()
                 # Обновляем ширину canvas window
                 if hasattr(self, 'history_canvas'):
                     self.history_canvas.itemconfig(self.canvas_window, width=event.width)
@@ -291,6 +304,12 @@ class ClipboardManager:
                               bg='#2c3e50', fg='#ecf0f1')
         title_label.pack(side='left')
         
+        # Счетчик записей в выбранном диапазоне
+        self.count_label = tk.Label(header_frame, text="",
+                                    font=('Segoe UI', 9),
+                                    bg='#2c3e50', fg='#95a5a6')
+        self.count_label.pack(side='left', padx=(10, 0))
+        
         clear_btn = tk.Button(header_frame, text="🗑️ Очистить", 
                             font=('Segoe UI', 9, 'bold'),
                             bg='#e74c3c', fg='white',
@@ -310,6 +329,46 @@ class ClipboardManager:
         clear_btn.bind("<Enter>", on_enter)
         clear_btn.bind("<Leave>", on_leave)
         
+        # Фильтр по времени
+        filter_var = tk.StringVar(value=self.time_filters[self.time_filter])
+        
+        def on_filter_change(label):
+            self.time_filter = next(key for key, value in self.time_filters.items() if value == label)
+            self.refresh_history()
+            self.history_canvas.yview_moveto(0)
+        
+        filter_menu = tk.OptionMenu(header_frame, filter_var, *self.time_filters.values(),
+                                    command=on_filter_change)
+        filter_menu.config(font=('Segoe UI', 9), bg='#34495e', fg='white',
+                           relief='flat', bd=0, highlightthickness=0,
+                           activebackground='#3d566e', activeforeground='white')
+        filter_menu.pack(side='right', padx=(0, 8))
+        
+        # Поиск по истории и архиву
+        self.search_text = ''
+        search_frame = tk.Frame(main_frame, bg='#34495e', padx=15, pady=6)
+        search_frame.pack(fill=tk.X)
+        search_entry = tk.Entry(search_frame, font=('Segoe UI', 10),
+                                bg='#ecf0f1', fg='#2c3e50',
+                                relief='flat', bd=4)
+        search_entry.pack(fill=tk.X)
+        
+        def on_search_change(event):
+            # Ждем паузу в наборе, чтобы не читать архив на каждую букву
+            if self.search_after_id:
+                self.window.after_cancel(self.search_after_id)
+            self.search_after_id = self.window.after(250, apply_search)
+        
+        def apply_search():
+            self.search_after_id = None
+            text = search_entry.get().strip()
+            if text != self.search_text:
+                self.search_text = text
+                self.refresh_history()
+                self.history_canvas.yview_moveto(0)
+        
+        search_entry.bind("<KeyRelease>", on_search_change)
+        
         # Скроллируемая область для истории
         self.history_canvas = tk.Canvas(main_frame, bg='#f8f9fa', highlightthickness=0)
         history_scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.history_canvas.yview)
@@ -322,7 +381,14 @@ class ClipboardManager:
         
         # Создаем окно на всю ширину canvas
         self.canvas_window = self.history_canvas.create_window((0, 0), window=self.history_scrollable, anchor="nw", width=self.window_width)
-        self.history_canvas.configure(yscrollcommand=history_scrollbar.set)
+        
+        # Догружаем следующую страницу, когда прокрутили почти до конца
+        def on_yscroll(first, last):
+            history_scrollbar.set(first, last)
+            if float(last) > 0.9:
+                self.load_more_cards()
+        
+        self.history_canvas.configure(yscrollcommand=on_yscroll)
         
         # Привязываем скролл колесом мыши (Linux)
         def on_mousewheel_up(event):
@@ -383,18 +449,88 @@ class ClipboardManager:
         self.window.geometry(f"{width}x{height}+{x}+{y}")
 
     def populate_history_cards(self, parent):
-        """Заполняем карточками истории"""
-        if not self.history:
+        """Заполняем карточками истории (первая страница, остальное - при прокрутке)"""
+        self.search_generation += 1
+        if self.search_text:
+            self.page_cursor = None
+            self.loop.create_task(self.load_search_page(parent, None, self.search_generation))
+            return
+        
+        since, until = self.time_range(self.time_filter)
+        page = self.store.query_history(limit=self.page_size, since=since, until=until)
+        self.page_cursor = page['next_cursor']
+        if self.count_label:
+            self.count_label.config(text=f"{page['total']} зап.")
+        
+        if not page['items'] and not self.store.pinned:
             no_data_label = tk.Label(parent, text="История пуста", 
                                    font=('Segoe UI', 12), 
                                    bg='#2d2d2d', fg='#888888')
             no_data_label.pack(pady=20)
             return
         
-        for i, entry in enumerate(self.history):
-            self.create_card(parent, entry, i, show_count=False)
+        # Номера слотов Ctrl+Alt+N
+        slots = {item['text']: i + 1 for i, item in enumerate(self.get_quick_entries())}
+        
+        # Закрепленные - сверху
+        for i, entry in enumerate(self.store.pinned):
+            self.create_card(parent, entry, i, pinned=True, slot=slots.get(entry['text']))
+        
+        self.add_history_cards(parent, page['items'], slots)
+
+    def add_history_cards(self, parent, entries, slots, skip_pinned=True):
+        """Добавляем карточки страницы истории (закрепленные уже показаны сверху)"""
+        pinned_texts = {item['text'] for item in self.store.pinned} if skip_pinned else set()
+        for i, entry in enumerate(entries):
+            if entry['text'] in pinned_texts:
+                continue
+            self.create_card(parent, entry, i, show_count=False, slot=slots.get(entry['text']))
+
+    async def load_search_page(self, parent, cursor, generation):
+        """Страница результатов поиска (архив читается в пуле потоков)"""
+        since, until = self.time_range(self.time_filter)
+        page = await self.search_history(self.search_text, cursor, self.page_size, since, until)
+        
+        # Пока искали, запрос поменялся или окно пересоздали
+        if generation != self.search_generation or not parent.winfo_exists():
+            return
+        self.page_cursor = page['next_cursor']
+        
+        if cursor is None:
+            if self.count_label:
+                self.count_label.config(text=f"найдено {page['total']}")
+            if not page['items']:
+                no_data_label = tk.Label(parent, text="Ничего не найдено", 
+                                       font=('Segoe UI', 12), 
+                                       bg='#2d2d2d', fg='#888888')
+                no_data_label.pack(pady=20)
+                return
+        
+        slots = {item['text']: i + 1 for i, item in enumerate(self.get_quick_entries())}
+        self.add_history_cards(parent, page['items'], slots, skip_pinned=False)
+
+    def load_more_cards(self):
+        """Подгружаем следующую страницу истории в окно"""
+        if self.page_cursor is None:
+            return
+        if not self.history_scrollable or not self.history_scrollable.winfo_exists():
+            return
+        
+        if self.search_text:
+            # Курсор сбрасываем сразу - следующая подгрузка только после ответа
+            cursor, self.page_cursor = self.page_cursor, None
+            self.loop.create_task(self.load_search_page(self.history_scrollable, cursor,
+                                                        self.search_generation))
+            return
+        
+        since, until = self.time_range(self.time_filter)
+        page = self.store.query_history(self.page_cursor, self.page_size, since, until)
+        self.page_cursor = page['next_cursor']
+        
+        slots = {item['text']: i + 1 for i, item in enumerate(self.get_quick_entries())}
+        self.add_history_cards(self.history_scrollable, page['items'], slots)
 
-    def create_card(self, parent, entry, index, show_count=False):
+    def create_card(self, parent, entry, index, show_count=False, pinned=False, slot=None):
         """Создаем карточку для записи"""
         # Внешний фрейм - рамка (белая)
         border_frame = tk.Frame(parent, bg='#ffffff', padx=1, pady=1)
@@ -414,6 +550,8 @@ class ClipboardManager:
         
         # Текст команды
         text_preview = entry['preview'].replace('\n', ' ').replace('\r', ' ')
+        if slot:
+            text_preview = f"{slot}  {text_preview}"
         text_label = tk.Label(content_frame, text=text_preview, 
                              font=('Consolas', 10), 
                              bg='#ffffff', fg='#2c3e50',
@@ -432,6 +570,19 @@ class ClipboardManager:
                              command=lambda: self.delete_entry(entry['text']))
         delete_btn.pack(side='right', padx=(8, 0))
         
+        # Кнопка закрепления
+        pin_bg = '#f39c12' if pinned else '#95a5a6'
+        pin_btn = tk.Button(content_frame, text="📌" if pinned else "📍", 
+                          font=('Segoe UI', 11),
+                          bg=pin_bg, fg='white',
+                          relief='flat', bd=0,
+                          padx=8, pady=4,
+                          cursor='hand2',
+                          activebackground='#d68910',
+                          activeforeground='white',
+                          command=lambda: self.toggle_pin(entry['text']))
+        pin_btn.pack(side='right', padx=(8, 0))
+        
         # Эффект hover для кнопки удаления
         def delete_on_enter(e):
             delete_btn.config(bg='#c0392b')
@@ -440,6 +591,10 @@ class ClipboardManager:
         delete_btn.bind("<Enter>", delete_on_enter)
         delete_btn.bind("<Leave>", delete_on_leave)
         
+        # Удаление закрепленной карточки = открепление
+        if pinned:
+            delete_btn.config(command=lambda: self.toggle_pin(entry['text']))
+        
         # Эффект hover для карточки
         def card_on_enter(e):
             border_frame.config(bg='#3498db')  # Синяя рамка
@@ -474,46 +629,47 @@ class ClipboardManager:
 
     def copy_and_hide(self, text):
         """Копируем текст и скрываем окно"""
+        # Сам клик обрабатываем сразу, pyperclip - в пуле
+        self.hide_history_window()
+        self.loop.create_task(self.copy_clicked(text))
+
+    async def copy_clicked(self, text):
+        """Копирование по клику (запись поднимется наверх при следующем опросе)"""
         try:
-            pyperclip.copy(text)
+            await self.copy_text(text, keep_order=False)
             print(f"📋 Скопировано: {text[:50]}...")
         except Exception as e:
             print(f"⚠️ Ошибка копирования: {e}")
-        finally:
-            self.hide_history_window()
 
     def stop(self):
         """Останавливаем менеджер"""
         self.running = False
-        if hasattr(self, 'key_listener'):
+        if self.key_listener:
             self.key_listener.stop()
+        # После Ctrl+C asyncio.run уже закрыл цикл - будить некого
+        if self.loop and self.stopped and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopped.set)
         print("👋 Менеджер буфера остановлен")
 
 def main():
     """Главная функция"""
     try:
-        # Создаем скрытое главное окно
-        root = tk.Tk()
-        root.withdraw()
-        
         print("🦬 Buffalo загружается...")
         
-        # Запускаем менеджер
-        manager = ClipboardManager(root)
-        
-        # Обработчик закрытия
-        def on_closing():
-            manager.stop()
-            root.quit()
+        # Запускаем менеджер (скрытое главное окно Tk создается по требованию)
+        manager = ClipboardManager()
+        manager.measure_startup = '--measure-startup' in sys.argv[1:]
         
-        root.protocol("WM_DELETE_WINDOW", on_closing)
-        
-        # Запускаем главный цикл
+        # Запускаем главный цикл (Tk обрабатывается внутри него)
         try:
-            root.mainloop()
+            asyncio.run(manager.run())
         except KeyboardInterrupt:
             print("\n🛑 Получен сигнал остановки")
             manager.stop()
+        
+        # Горячие клавиши или захват так и не поднялись
+        if manager.startup_error:
+            raise manager.startup_error
             
     except Exception as e:
         print(f"💥 Критическая ошибка: {e}")
@@ -2,147 +2,103 @@
 """
 Мультибуфер обмена с HTML интерфейсом через Eel
 Горячие клавиши: Ctrl+F - показать/скрыть, Esc - скрыть
+Ctrl+Alt+1..9 - вставить N-ю закрепленную/последнюю запись без окна
+
+Ядро (clipboard_core.py) - опрос буфера, горячие клавиши, отложенное
+сохранение - работает в цикле asyncio в отдельном потоке, главный занят
+Eel (gevent). Вызовы из JS выполняются в цикле через ClipboardManager.call,
+команды окну (show/hide) идут обратно через очередь и отправляются из
+гринлета Eel. Ответ цикла ждем в пуле потоков gevent, чтобы не стоял хаб.
+
+При запуске первыми поднимаются горячие клавиши и захват буфера, история
+читается в фоне, eel импортируется и открывает окно уже после них.
+--measure-startup - замерить время запуска и выйти.
 """
 
-import eel
-import pyperclip
-import threading
 import time
-from datetime import datetime
-from pynput import keyboard
-import json
-import os
 
-class ClipboardManager:
-    def __init__(self):
-        self.history = []
-        self.max_history = 50
-        self.last_clipboard = ""
-        self.running = True
-        self.data_file = os.path.join(os.path.dirname(__file__), 'clipboard_history.json')
-        self.keys_pressed = set()
-        self.window_visible = False
-        self.clipboard_lock = threading.Lock()
-        self.save_lock = threading.Lock()
-        
-        # Загружаем историю
-        self.load_history()
-        
-        # Запускаем мониторинг буфера в фоне
-        self.monitor_thread = threading.Thread(target=self.monitor_clipboard, daemon=True)
-        self.monitor_thread.start()
-        
-        # Настраиваем горячие клавиши
-        self.setup_hotkeys()
-        
-        print("📋 Мультибуфер запущен!")
-        print("🔥 Ctrl+F - показать/скрыть (любая раскладка)")
-        print("🔥 Esc - скрыть окно")
-        print(f"📚 Загружено {len(self.history)} записей")
+STARTED_AT = time.perf_counter()  # Отсчет для --measure-startup
 
-    def load_history(self):
-        """Загружаем историю из файла"""
-        try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.history = data.get('history', [])
-        except Exception as e:
-            print(f"⚠️ Ошибка загрузки истории: {e}")
+import asyncio
+import queue
+import sys
+import threading
 
-    def save_history(self):
-        """Сохраняем историю в файл"""
-        with self.save_lock:
-            try:
-                temp_file = self.data_file + '.tmp'
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    json.dump({'history': self.history}, f, ensure_ascii=False, indent=2)
-                os.replace(temp_file, self.data_file)
-            except Exception as e:
-                print(f"⚠️ Ошибка сохранения: {e}")
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
+import clipboard_core as core
 
-    def monitor_clipboard(self):
-        """Мониторинг изменений буфера обмена"""
-        while self.running:
-            try:
-                current_clipboard = pyperclip.paste()
-                
-                with self.clipboard_lock:
-                    if (current_clipboard != self.last_clipboard and 
-                        current_clipboard.strip() and 
-                        2 <= len(current_clipboard.strip()) <= 50):
-                        
-                        self.add_to_history(current_clipboard)
-                        self.last_clipboard = current_clipboard
-                    
-            except Exception as e:
-                print(f"⚠️ Ошибка мониторинга: {e}")
-            
-            time.sleep(0.3)
+# eel импортируется в main, когда ядро уже работает (pynput и pyperclip - в ядре)
+eel = None
+gevent = None
 
-    def add_to_history(self, text):
-        """Добавляем текст в историю"""
-        try:
-            clean_text = text.encode('utf-8', errors='replace').decode('utf-8')
-            if not (2 <= len(clean_text.strip()) <= 50):
-                return
-        except:
-            return
-        
-        # Убираем дубликаты
-        self.history = [item for item in self.history if item['text'] != clean_text]
-        
-        # Добавляем новую запись в начало
-        entry = {
-            'text': clean_text,
-            'timestamp': datetime.now().isoformat(),
-            'preview': clean_text[:80] + ('...' if len(clean_text) > 80 else '')
-        }
-        
-        self.history.insert(0, entry)
-        
-        # Ограничиваем размер истории
-        if len(self.history) > self.max_history:
-            self.history = self.history[:self.max_history]
+def import_eel():
+    """Импортируем eel (и gevent, на котором он работает)"""
+    global eel, gevent
+    import eel
+    import gevent
+
+class ClipboardManager(core.ClipboardCore):
+    def __init__(self):
+        super().__init__()
+        self.started_at = STARTED_AT
+        self.ui_messages = queue.Queue(maxsize=8)  # Команды окну (show/hide): из цикла в гринлет Eel
         
-        self.save_history()
-        print(f"📋 Добавлено: {entry['preview']}")
+        print("📋 Мультибуфер запущен!")
+        print("🔥 Ctrl+F - показать/скрыть (любая раскладка)")
+        print("🔥 Esc - скрыть окно")
 
-    def setup_hotkeys(self):
-        """Настройка горячих клавиш"""
-        def on_press(key):
-            try:
-                if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
-                    self.keys_pressed.add('ctrl')
-                elif key == keyboard.Key.esc:
-                    if self.window_visible:
-                        self.hide_window()
-                elif hasattr(key, 'char') and key.char:
-                    char = key.char.lower()
-                    if char in ['f', 'а']:
-                        self.keys_pressed.add('f')
-                        if {'ctrl', 'f'} == self.keys_pressed:
-                            self.toggle_window()
-            except AttributeError:
-                pass
-
-        def on_release(key):
-            try:
-                if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
-                    self.keys_pressed.discard('ctrl')
-                elif hasattr(key, 'char') and key.char:
-                    char = key.char.lower()
-                    if char in ['f', 'а']:
-                        self.keys_pressed.discard('f')
-            except AttributeError:
-                pass
-
-        self.key_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
-        self.key_listener.start()
+    def start(self):
+        """Запускаем цикл в фоновом потоке и ждем, пока поднимутся горячие клавиши и захват"""
+        self.loop_thread = threading.Thread(target=lambda: asyncio.run(self.run()),
+                                            name='buffalo-loop', daemon=True)
+        self.loop_thread.start()
+        self.core_ready.wait()
+
+    def call(self, func, *args):
+        """Выполняем func в цикле и ждем результат (для вызовов из Eel)"""
+        async def wrapper():
+            result = func(*args)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+        future = asyncio.run_coroutine_threadsafe(wrapper(), self.loop)
+        # Ждем в пуле потоков gevent: поиск по архиву не должен останавливать хаб Eel
+        return gevent.get_hub().threadpool.spawn(future.result).get()
+
+    async def on_key_press(self, key, pressed_at):
+        """Нажатие клавиши"""
+        Key = core.keyboard.Key
+        if key == Key.ctrl_l or key == Key.ctrl_r:
+            self.keys_pressed.add('ctrl')
+        elif key in (Key.alt_l, Key.alt_r, Key.alt_gr):
+            self.keys_pressed.add('alt')
+        elif {'ctrl', 'alt'} <= self.keys_pressed and self.quick_slot(key):
+            # Ctrl+Alt+N - быстрая вставка без окна
+            await self.quick_paste(self.quick_slot(key))
+        elif key == Key.esc:
+            if self.window_visible:
+                self.hide_window()
+        elif hasattr(key, 'char') and key.char:
+            char = key.char.lower()
+            if char in ['f', 'а']:
+                self.keys_pressed.add('f')
+                if {'ctrl', 'f'} == self.keys_pressed:
+                    self.toggle_window()
+
+    async def on_key_release(self, key):
+        """Отпускание клавиши"""
+        Key = core.keyboard.Key
+        if key == Key.ctrl_l or key == Key.ctrl_r:
+            self.keys_pressed.discard('ctrl')
+        elif key in (Key.alt_l, Key.alt_r, Key.alt_gr):
+            self.keys_pressed.discard('alt')
+            # Вставляем только после отпускания Alt, иначе уйдет Ctrl+Alt+V
+            if self.pending_paste:
+                self.pending_paste = False
+                await self.loop.run_in_executor(self.executor, self.synthesize_paste)
+        elif hasattr(key, 'char') and key.char:
+            char = key.char.lower()
+            if char in ['f', 'а']:
+                self.keys_pressed.discard('f')
 
     def toggle_window(self):
         """Toggle видимости окна"""
@@ -154,68 +110,118 @@ class ClipboardManager:
     def show_window(self):
         """Показываем окно"""
         self.window_visible = True
-        eel.show_window()
+        self.post_ui('show')
 
     def hide_window(self):
         """Прячем окно"""
         self.window_visible = False
-        eel.hide_window()
+        self.post_ui('hide')
 
-    def get_history(self):
-        """Возвращаем историю для JS"""
-        return self.history
+    def post_ui(self, message):
+        """Ставим команду окну в очередь (в потоке цикла)"""
+        while True:
+            try:
+                self.ui_messages.put_nowait(message)
+                return
+            except queue.Full:
+                # Окно не успевает - важно только последнее состояние
+                try:
+                    self.ui_messages.get_nowait()
+                except queue.Empty:
+                    pass
 
-    def clear_history(self):
-        """Очищаем всю историю"""
-        self.history = []
-        self.save_history()
-        print("🗑️ История очищена")
+    def pump_ui(self):
+        """Гринлет Eel: отправляем команды в окно по одной"""
+        threadpool = gevent.get_hub().threadpool
+        while True:
+            # Блокирующий get уходит в пул потоков, хаб gevent продолжает работать
+            message = threadpool.spawn(self.ui_messages.get).get()
+            if message is None:
+                break  # stop()
+            try:
+                if message == 'show':
+                    eel.show_window()
+                else:
+                    eel.hide_window()
+            except Exception as e:
+                print(f"⚠️ Ошибка связи с окном: {e}")
 
-    def delete_entry(self, text):
-        """Удаляем конкретную запись"""
-        self.history = [item for item in self.history if item['text'] != text]
-        self.save_history()
-        print(f"🗑️ Удалено: {text[:30]}...")
+    def get_pinned(self):
+        """Возвращаем закрепленные записи для JS (с номерами слотов)"""
+        slots = {item['text']: i + 1 for i, item in enumerate(self.get_quick_entries())}
+        return [dict(item, slot=slots.get(item['text'])) for item in self.store.pinned]
 
-    def copy_to_clipboard(self, text):
+    async def copy_to_clipboard(self, text):
         """Копируем текст в буфер"""
         try:
-            with self.clipboard_lock:
-                self.last_clipboard = text
-                pyperclip.copy(text)
+            await self.copy_text(text)
             print(f"📋 Скопировано: {text[:50]}...")
             self.hide_window()
         except Exception as e:
             print(f"⚠️ Ошибка копирования: {e}")
 
+    def stop(self):
+        """Останавливаем менеджер"""
+        self.running = False
+        # Цикл мог уже завершиться сам (замер запуска, ошибка запуска)
+        if self.loop and self.stopped and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.loop_thread.join(timeout=5)
+        self.post_ui(None)  # Отпускаем pump_ui
+        print("👋 Мультибуфер остановлен")
+
 # Глобальный менеджер
 manager = None
 
-# Expose функции для JS
-@eel.expose
+# Функции для JS (регистрируются в expose_api после импорта eel)
 def get_history():
-    return manager.get_history()
+    return manager.call(manager.store.get_history)
+
+def query_history(cursor=None, limit=20, since=None, until=None):
+    return manager.call(manager.store.query_history, cursor, limit, since, until)
+
+def search_history(text, cursor=None, limit=20, since=None, until=None):
+    return manager.call(manager.search_history, text, cursor, limit, since, until)
+
+def get_pinned():
+    return manager.call(manager.get_pinned)
+
+def toggle_pin(text):
+    manager.call(manager.toggle_pin, text)
 
-@eel.expose
 def clear_history():
-    manager.clear_history()
+    manager.call(manager.clear_history)
 
-@eel.expose
 def delete_entry(text):
-    manager.delete_entry(text)
+    manager.call(manager.delete_entry, text)
 
-@eel.expose
 def copy_to_clipboard(text):
-    manager.copy_to_clipboard(text)
+    manager.call(manager.copy_to_clipboard, text)
+
+def expose_api():
+    """Регистрируем функции для JS"""
+    for func in (get_history, query_history, search_history, get_pinned, toggle_pin,
+                 clear_history, delete_entry, copy_to_clipboard):
+        eel.expose(func)
 
 def main():
     global manager
     
+    # Сначала ядро: горячие клавиши и захват буфера
+    manager = ClipboardManager()
+    manager.measure_startup = '--measure-startup' in sys.argv[1:]
+    manager.start()
+    
+    # В замере ждем конца замера; если ядро не поднялось - окно не нужно
+    if manager.measure_startup or manager.startup_error:
+        manager.loop_thread.join()
+        return
+    
     # Инициализируем Eel
+    import_eel()
+    expose_api()
     eel.init('web')
-    
-    # Создаем менеджер
-    manager = ClipboardManager()
+    eel.spawn(manager.pump_ui)
     
     # Запускаем окно
     try:
@@ -226,6 +232,10 @@ def main():
                   close_callback=lambda *args: None)
     except Exception as e:
         print(f"💥 Ошибка запуска: {e}")
+    except KeyboardInterrupt:
+        print("\n🛑 Получен сигнал остановки")
+    finally:
+        manager.stop()
 
 if __name__ == "__main__":
     main()
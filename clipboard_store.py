@@ -0,0 +1,524 @@
+"""
+Хранилище истории буфера - общее ядро обоих интерфейсов
+
+Живая история в памяти (временной индекс + очередь вытеснения), закрепленные
+записи и холодный архив вытесненного в сжатых сегментах на диске.
+
+Все методы синхронные и ничего не знают про asyncio. Помеченные
+"в пуле потоков" работают с диском - интерфейсы вызывают их через executor,
+остальные - только из потока цикла.
+"""
+
+import bisect
+import gzip
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Настройки хранилища, которые можно переопределить в clipboard_history.json.
+# Обратно пишутся только заданные в файле - новые умолчания доходят до всех
+SETTINGS = ('history_byte_budget', 'max_entry_age_days', 'protect_uses', 'protected_share',
+            'archive_evicted')
+
+# Прежние версии писали в файл все настройки подряд, с этими умолчаниями.
+# Такие значения - не выбор пользователя, при загрузке их пропускаем
+LEGACY_DEFAULTS = {'history_byte_budget': 64 * 1024, 'max_entry_age_days': 90, 'protect_uses': 3,
+                   'protected_share': 0.5, 'archive_evicted': True}
+
+class HistoryStore:
+    def __init__(self, data_file, archive_dir):
+        self.data_file = data_file
+        self.time_index = []  # Отсортированные ключи (unix-время, текст) - для выборок по времени
+        self.entries_by_text = {}  # Текст -> запись
+        self.probation = OrderedDict()  # Очередь вытеснения обычных записей, от старых к новым
+        self.protected = OrderedDict()  # Очередь часто копируемых, от старых к новым
+        self.history_bytes = 0  # Сколько байт текста сейчас в истории
+        self.protected_bytes = 0  # Из них - в очереди часто копируемых
+        self.pinned = []  # Закрепленные записи (не удаляются очисткой и вытеснением)
+        self.file_settings = set()  # Какие из SETTINGS заданы в файле истории
+        
+        # Вытеснение: пока хоть одна политика говорит "да" про голову очереди
+        self.history_byte_budget = 64 * 1024  # Бюджет на текст истории в памяти
+        self.max_entry_age_days = 0  # Записи старше вытесняются (0 - без ограничения, по умолчанию)
+        self.protect_uses = 3  # Скопированные столько раз - часто копируемые (0 - выкл.)
+        self.protected_share = 0.5  # Доля бюджета, зарезервированная за часто копируемыми
+        self.eviction_policies = [self.over_byte_budget, self.too_old]
+        
+        # Холодный уровень: вытесненное уходит в сжатые сегменты на диске.
+        # Выключен по умолчанию - на диске остались бы и скопированные пароли
+        self.archive_evicted = False
+        self.archive_dir = archive_dir
+        self.archive_segment_size = 1000  # Записей в одном сегменте
+        self.archive_max_segments = 100  # Самые старые сегменты сверх лимита удаляются
+        self.archive_pending = []  # Вытесненные, но еще не записанные в архив
+        self.archive_purge = set()  # Удаленные тексты - вычистить из архива при следующей записи
+        self.archive_reset = False  # Архив нужно стереть при следующей записи
+        self.deleted_at = {}  # Текст -> когда удален: более старые копии из архива не показываем
+        self.cleared_at = float('-inf')  # Когда очистили историю: более старый архив не показываем
+        self.archive_version = 0  # Растет при каждом изменении архива на диске
+        self.archive_cache = None  # Последний результат search_archive (для страниц и уточнений)
+
+    def read_file(self):
+        """Читаем файл истории (в пуле потоков)"""
+        if not os.path.exists(self.data_file):
+            return {}
+        with open(self.data_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self, data):
+        """Подмешиваем прочитанный файл к тому, что успели накопить до него
+        
+        Что успели скопировать и закрепить, пока читали файл, остается сверху.
+        Возвращает True, если состояние отличается от файла и его надо записать.
+        """
+        captured = self.get_history()
+        known = {item['text'] for item in captured}
+        pinned = {item['text'] for item in self.pinned}
+        self.pinned = [item for item in data.get('pinned', [])
+                       if item['text'] not in pinned] + self.pinned
+        settings = {name: data[name] for name in SETTINGS if name in data}
+        if settings.keys() >= LEGACY_DEFAULTS.keys() - {'protected_share'}:
+            settings = {name: value for name, value in settings.items()
+                        if LEGACY_DEFAULTS[name] != value}
+        self.file_settings = set(settings)
+        for name, value in settings.items():
+            setattr(self, name, value)
+        self.set_history(captured + [item for item in data.get('history', [])
+                                     if item['text'] not in known])
+        self.evict()
+        return bool(captured or self.archive_pending)
+
+    def snapshot(self):
+        """Снимок для записи на диск (в потоке цикла)"""
+        data = {
+            'history': self.get_history(),
+            'pinned': list(self.pinned)
+        }
+        for name in self.file_settings:
+            data[name] = getattr(self, name)
+        return data
+
+    def save_file(self, data):
+        """Атомарно записываем снимок в файл истории (в пуле потоков)"""
+        temp_file = self.data_file + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.data_file)
+        except Exception as e:
+            print(f"⚠️ Ошибка сохранения истории: {e}")
+            # Удаляем поврежденный временный файл
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+
+    def take_archive_changes(self):
+        """Забираем накопленные изменения архива для записи (в потоке цикла)"""
+        changes = (self.archive_pending, self.archive_purge, self.archive_reset)
+        self.archive_pending = []
+        self.archive_purge = set()
+        self.archive_reset = False
+        return changes
+
+    def write_archive(self, changes):
+        """Применяем изменения из take_archive_changes к архиву (в пуле потоков)
+        
+        Возвращает тексты, чьи удаленные копии уже вычищены с диска.
+        """
+        archived, purge, reset = changes
+        purged = set()
+        if reset:
+            self.clear_archive()
+            purged = purge
+        elif purge and self.purge_archive(purge):
+            # До дозаписи: в archived может быть уже новая копия удаленного текста
+            purged = purge
+        if archived:
+            self.flush_archive(archived)
+        return purged
+
+    def forget_deleted(self, purged):
+        """Копий purged в архиве больше нет - время удаления не нужно (в потоке цикла)"""
+        for text in purged - self.archive_purge:  # Удаленные повторно ждут своей очистки
+            self.deleted_at.pop(text, None)
+
+    def entry_key(self, entry):
+        """Ключ записи во временном индексе: (unix-время, текст)"""
+        return (datetime.fromisoformat(entry['timestamp']).timestamp(), entry['text'])
+
+    def entry_size(self, entry):
+        """Сколько запись занимает в бюджете истории (байты UTF-8)"""
+        return len(entry['text'].encode('utf-8'))
+
+    def get_history(self):
+        """История от новых к старым"""
+        return [self.entries_by_text[text] for _, text in reversed(self.time_index)]
+
+    def set_history(self, entries):
+        """Заменяем историю целиком (entries - от новых к старым) и строим индексы"""
+        self.time_index = []
+        self.entries_by_text = {}
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.history_bytes = 0
+        self.protected_bytes = 0
+        # В очереди вытеснения - от старых к новым
+        for entry in reversed(entries):
+            entry.setdefault('uses', 1)
+            self.index_add(entry)
+
+    def add(self, text):
+        """Кладем текст наверх истории и возвращаем новую запись
+        
+        Повторное копирование считаем использованием: дубликат убирается,
+        счетчик uses переходит к новой записи.
+        """
+        uses = 1
+        if text in self.entries_by_text:
+            old_entry = self.entries_by_text[text]
+            uses = old_entry.get('uses', 1) + 1
+            self.index_remove(old_entry)
+        
+        entry = {
+            'text': text,
+            'timestamp': datetime.now().isoformat(),
+            'preview': text[:80] + ('...' if len(text) > 80 else ''),
+            'uses': uses
+        }
+        self.index_add(entry)
+        self.evict()
+        return entry
+
+    def touch(self, text):
+        """Считаем использование записи без подъема наверх (быстрая вставка)"""
+        entry = self.entries_by_text.get(text)
+        if entry is None:
+            return False
+        entry['uses'] += 1
+        if text in self.probation and self.is_protected(entry):
+            # Дошла до порога - переводим в очередь часто копируемых
+            del self.probation[text]
+            self.protected[text] = entry
+            self.protected_bytes += self.entry_size(entry)
+            self.evict()
+        return True
+
+    def delete(self, text):
+        """Удаляем запись из истории и все ее копии из архива"""
+        if text in self.entries_by_text:
+            self.index_remove(self.entries_by_text[text])
+        self.archive_pending = [entry for entry in self.archive_pending if entry['text'] != text]
+        self.archive_purge.add(text)
+        self.deleted_at[text] = datetime.now().timestamp()
+
+    def clear(self):
+        """Очищаем историю и архив (закрепленные записи остаются)"""
+        self.set_history([])
+        self.archive_pending = []
+        self.archive_purge = set()
+        self.archive_reset = True
+        self.deleted_at = {}
+        # Архив сотрется при следующей записи, а скрыть его надо уже сейчас
+        self.cleared_at = datetime.now().timestamp()
+        self.archive_version += 1
+        self.archive_cache = None
+
+    def toggle_pin(self, text):
+        """Закрепляем/открепляем запись, возвращаем True если теперь закреплена"""
+        if any(item['text'] == text for item in self.pinned):
+            self.pinned = [item for item in self.pinned if item['text'] != text]
+            return False
+        entry = self.entries_by_text.get(text)
+        if entry is None:
+            entry = {
+                'text': text,
+                'timestamp': datetime.now().isoformat(),
+                'preview': text[:80] + ('...' if len(text) > 80 else '')
+            }
+        self.pinned.append(dict(entry))
+        return True
+
+    def quick_entries(self, count):
+        """Записи для быстрой вставки: сначала закрепленные, потом последние"""
+        pinned_texts = {item['text'] for item in self.pinned}
+        page = self.query_history(limit=len(self.pinned) + count)
+        recent = [item for item in page['items'] if item['text'] not in pinned_texts]
+        return (self.pinned + recent)[:count]
+
+    def is_protected(self, entry):
+        """Запись копировали достаточно часто, чтобы беречь ее от вытеснения"""
+        return bool(self.protect_uses) and entry.get('uses', 1) >= self.protect_uses
+
+    def index_add(self, entry):
+        """Добавляем запись во временной индекс и в конец своей очереди вытеснения"""
+        bisect.insort(self.time_index, self.entry_key(entry))
+        self.entries_by_text[entry['text']] = entry
+        self.history_bytes += self.entry_size(entry)
+        if self.is_protected(entry):
+            self.protected[entry['text']] = entry
+            self.protected_bytes += self.entry_size(entry)
+        else:
+            self.probation[entry['text']] = entry
+
+    def index_remove(self, entry):
+        """Убираем запись из временного индекса и очереди вытеснения"""
+        key = self.entry_key(entry)
+        i = bisect.bisect_left(self.time_index, key)
+        if i < len(self.time_index) and self.time_index[i] == key:
+            del self.time_index[i]
+        if self.entries_by_text.pop(entry['text'], None) is not None:
+            self.history_bytes -= self.entry_size(entry)
+        self.probation.pop(entry['text'], None)
+        if self.protected.pop(entry['text'], None) is not None:
+            self.protected_bytes -= self.entry_size(entry)
+
+    def over_byte_budget(self, entry):
+        """Политика вытеснения: история не влезает в бюджет байт"""
+        return self.history_bytes > self.history_byte_budget
+
+    def too_old(self, entry):
+        """Политика вытеснения: запись старше max_entry_age_days"""
+        if not self.max_entry_age_days:
+            return False
+        return time.time() - self.entry_key(entry)[0] > self.max_entry_age_days * 86400
+
+    def evict(self):
+        """Вытесняем записи из голов очередей, пока этого требует хоть одна политика
+        
+        Сегментированный LRU: часто копируемые (uses >= protect_uses) живут
+        в своей очереди с зарезервированной долей бюджета protected_share,
+        поэтому поток разовых копий вытесняет только обычные записи.
+        Часто копируемые сверх своей доли переходят в хвост обычной очереди.
+        Политики проверяются сначала на обычной очереди, потом на защищенной.
+        
+        Голова очереди снимается за O(1), но из time_index (отсортированный
+        список) запись удаляется сдвигом - O(n) на вытеснение, где n - число
+        записей в бюджете (тысячи, это быстрый memmove).
+        """
+        while self.protected and self.protected_bytes > self.history_byte_budget * self.protected_share:
+            text, entry = self.protected.popitem(last=False)
+            self.protected_bytes -= self.entry_size(entry)
+            self.probation[text] = entry
+        
+        for queue in (self.probation, self.protected):
+            while queue:
+                entry = next(iter(queue.values()))
+                if not any(policy(entry) for policy in self.eviction_policies):
+                    break
+                self.index_remove(entry)
+                if self.archive_evicted:
+                    self.archive_pending.append(entry)
+
+    def read_archive_manifest(self):
+        """Оглавление архива: сегменты с числом записей и диапазоном времени"""
+        path = os.path.join(self.archive_dir, 'index.json')
+        if not os.path.exists(path):
+            return {'segments': [], 'next_id': 1}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_archive_segment(self, name):
+        """Записи одного сегмента архива"""
+        try:
+            with gzip.open(os.path.join(self.archive_dir, name), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+        except (OSError, EOFError, ValueError):
+            # Сегмент дописывается прямо сейчас или поврежден - берем что успели прочитать
+            return
+
+    def flush_archive(self, entries):
+        """Дописываем вытесненные записи в сжатый сегмент архива (в пуле потоков)"""
+        try:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            manifest = self.read_archive_manifest()
+            segments = manifest['segments']
+            if not segments or segments[-1]['count'] >= self.archive_segment_size:
+                segments.append({
+                    'file': f"segment-{manifest['next_id']:06d}.jsonl.gz",
+                    'count': 0,
+                    'first_ts': None,
+                    'last_ts': None
+                })
+                manifest['next_id'] += 1
+            segment = segments[-1]
+            
+            # Каждая дозапись - отдельный gzip-member, читается как один поток
+            with gzip.open(os.path.join(self.archive_dir, segment['file']), 'at', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            
+            stamps = [self.entry_key(entry)[0] for entry in entries]
+            if segment['first_ts'] is not None:
+                stamps += [segment['first_ts'], segment['last_ts']]
+            segment['count'] += len(entries)
+            segment['first_ts'] = min(stamps)
+            segment['last_ts'] = max(stamps)
+            
+            # Диск тоже ограничен: самые старые сегменты удаляем
+            while len(segments) > self.archive_max_segments:
+                try:
+                    os.remove(os.path.join(self.archive_dir, segments.pop(0)['file']))
+                except OSError:
+                    pass
+            
+            self.write_archive_manifest(manifest)
+            self.archive_version += 1
+        except Exception as e:
+            print(f"⚠️ Ошибка записи архива: {e}")
+
+    def purge_archive(self, texts):
+        """Переписываем сегменты, где есть удаленные тексты, уже без них (в пуле потоков)
+        
+        Возвращает True, если архив вычищен.
+        """
+        try:
+            manifest = self.read_archive_manifest()
+            segments = []
+            changed = False
+            for segment in manifest['segments']:
+                entries = list(self.read_archive_segment(segment['file']))
+                kept = [entry for entry in entries if entry['text'] not in texts]
+                path = os.path.join(self.archive_dir, segment['file'])
+                if len(kept) == len(entries):
+                    segments.append(segment)
+                    continue
+                changed = True
+                if not kept:
+                    os.remove(path)
+                    continue
+                
+                temp_file = path + '.tmp'
+                with gzip.open(temp_file, 'wt', encoding='utf-8') as f:
+                    for entry in kept:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                os.replace(temp_file, path)
+                
+                stamps = [self.entry_key(entry)[0] for entry in kept]
+                segment['count'] = len(kept)
+                segment['first_ts'] = min(stamps)
+                segment['last_ts'] = max(stamps)
+                segments.append(segment)
+            
+            if changed:
+                manifest['segments'] = segments
+                self.write_archive_manifest(manifest)
+                self.archive_version += 1
+            return True
+        except Exception as e:
+            print(f"⚠️ Ошибка очистки архива: {e}")
+            return False
+
+    def write_archive_manifest(self, manifest):
+        """Атомарно записываем оглавление архива (в пуле потоков)"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        temp_file = os.path.join(self.archive_dir, 'index.json.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, os.path.join(self.archive_dir, 'index.json'))
+
+    def clear_archive(self):
+        """Удаляем архив целиком (в пуле потоков)"""
+        try:
+            for segment in self.read_archive_manifest()['segments']:
+                os.remove(os.path.join(self.archive_dir, segment['file']))
+            os.remove(os.path.join(self.archive_dir, 'index.json'))
+        except OSError:
+            pass
+        self.archive_version += 1
+
+    def search_archive(self, needle, since=None, until=None):
+        """Все копии из архива с подстрокой needle в [since, until), от новых к старым (в пуле потоков)
+        
+        Последний результат кэшируется: следующие страницы того же запроса и
+        его уточнение (дописали буквы, сузили диапазон) фильтруют кэш, а не
+        распаковывают сегменты заново. Любое изменение архива сбрасывает кэш.
+        """
+        version = self.archive_version
+        cache = self.archive_cache
+        if (cache is not None and cache['version'] == version and cache['needle'] in needle and
+                (cache['since'] is None or since is not None and since >= cache['since']) and
+                (cache['until'] is None or until is not None and until <= cache['until'])):
+            candidates = cache['found']
+        else:
+            candidates = []
+            for segment in self.read_archive_manifest()['segments']:
+                if since is not None and segment['last_ts'] < since:
+                    continue
+                if until is not None and segment['first_ts'] >= until:
+                    continue
+                candidates.extend(self.read_archive_segment(segment['file']))
+            candidates.sort(key=self.entry_key, reverse=True)
+        
+        found = []
+        for entry in candidates:
+            stamp = self.entry_key(entry)[0]
+            if ((since is None or stamp >= since) and (until is None or stamp < until) and
+                    needle in entry['text'].lower()):
+                found.append(entry)
+        
+        self.archive_cache = {'needle': needle, 'since': since, 'until': until,
+                              'version': version, 'found': found}
+        return found
+
+    def query_history(self, cursor=None, limit=20, since=None, until=None):
+        """Страница истории от новых к старым
+        
+        cursor - next_cursor предыдущей страницы, since/until - unix-время,
+        диапазон [since, until). Возвращает {'items', 'next_cursor', 'total'},
+        total - сколько всего записей в диапазоне.
+        """
+        lo = bisect.bisect_left(self.time_index, (since,)) if since is not None else 0
+        hi = bisect.bisect_left(self.time_index, (until,)) if until is not None else len(self.time_index)
+        total = max(0, hi - lo)
+        
+        # Курсор - ключ последней выданной записи, дальше идут строго более старые
+        if cursor is not None:
+            hi = min(hi, bisect.bisect_left(self.time_index, tuple(cursor)))
+        start = max(lo, hi - limit)
+        keys = self.time_index[start:hi][::-1]
+        
+        return {
+            'items': [self.entries_by_text[text] for _, text in keys],
+            'next_cursor': list(keys[-1]) if keys and start > lo else None,
+            'total': total
+        }
+
+    def search_history(self, text, cursor=None, limit=20, since=None, until=None, archived=()):
+        """Поиск подстроки в истории и в найденном search_archive, от новых к старым
+        
+        Параметры и ответ - как у query_history. Из архива берется самая
+        свежая копия текста, и только если его нет в живой истории.
+        Копии, удаленные (или очищенные), но еще не вычищенные из архива, пропускаются.
+        """
+        needle = text.lower()
+        lo = bisect.bisect_left(self.time_index, (since,)) if since is not None else 0
+        hi = bisect.bisect_left(self.time_index, (until,)) if until is not None else len(self.time_index)
+        matches = {key[1]: key for key in self.time_index[lo:hi] if needle in key[1].lower()}
+        entries = {text: self.entries_by_text[text] for text in matches}
+        
+        for entry in archived:
+            key = self.entry_key(entry)
+            if key[0] < max(self.cleared_at, self.deleted_at.get(entry['text'], float('-inf'))):
+                continue
+            if entry['text'] in entries and (entry['text'] in self.entries_by_text or
+                                             key <= matches[entry['text']]):
+                continue
+            matches[entry['text']] = key
+            entries[entry['text']] = entry
+        
+        keys = sorted(matches.values(), reverse=True)
+        total = len(keys)
+        # Курсор - ключ последней выданной записи, дальше идут строго более старые
+        if cursor is not None:
+            keys = [key for key in keys if key < tuple(cursor)]
+        page = keys[:limit]
+        
+        return {
+            'items': [entries[text] for _, text in page],
+            'next_cursor': list(page[-1]) if len(keys) > limit else None,
+            'total': total
+        }
@@ -0,0 +1,294 @@
+"""Тесты общего хранилища истории: выборки, поиск, вытеснение, архив"""
+
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clipboard_store import HistoryStore
+
+
+def make_entry(text, minutes_ago, uses=1):
+    """Запись истории, скопированная minutes_ago минут назад"""
+    return {
+        'text': text,
+        'timestamp': (datetime.now() - timedelta(minutes=minutes_ago)).isoformat(),
+        'preview': text,
+        'uses': uses
+    }
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(os.path.join(self.tmp.name, 'history.json'),
+                                  os.path.join(self.tmp.name, 'archive'))
+        self.store.archive_evicted = True  # Архив выключен по умолчанию, тесты проверяют и его
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def flush(self):
+        """Пишем накопленные изменения архива, как это делает persist_history"""
+        self.store.forget_deleted(self.store.write_archive(self.store.take_archive_changes()))
+
+    def texts(self, page):
+        return [entry['text'] for entry in page['items']]
+
+    def test_query_pages_from_newest_to_oldest(self):
+        self.store.set_history([make_entry(f'item{i:02d}', i) for i in range(7)])
+
+        first = self.store.query_history(limit=3)
+        second = self.store.query_history(first['next_cursor'], limit=3)
+        last = self.store.query_history(second['next_cursor'], limit=3)
+
+        self.assertEqual(self.texts(first), ['item00', 'item01', 'item02'])
+        self.assertEqual(self.texts(second), ['item03', 'item04', 'item05'])
+        self.assertEqual(self.texts(last), ['item06'])
+        self.assertIsNone(last['next_cursor'])
+        self.assertEqual(first['total'], 7)
+
+    def test_query_time_range(self):
+        self.store.set_history([make_entry(f'item{i:02d}', i * 30) for i in range(6)])
+        since = (datetime.now() - timedelta(minutes=100)).timestamp()
+        until = (datetime.now() - timedelta(minutes=10)).timestamp()
+
+        page = self.store.query_history(limit=10, since=since, until=until)
+
+        self.assertEqual(self.texts(page), ['item01', 'item02', 'item03'])
+        self.assertEqual(page['total'], 3)
+
+    def test_add_moves_duplicate_to_top_and_counts_use(self):
+        self.store.add('alpha')
+        self.store.add('beta')
+        entry = self.store.add('alpha')
+
+        self.assertEqual([e['text'] for e in self.store.get_history()], ['alpha', 'beta'])
+        self.assertEqual(entry['uses'], 2)
+
+    def test_byte_budget_evicts_oldest_into_archive(self):
+        self.store.history_byte_budget = 30
+        for i in range(10):
+            self.store.add(f'item{i:02d}')
+
+        self.assertLessEqual(self.store.history_bytes, 30)
+        self.assertEqual(self.store.get_history()[-1]['text'], 'item05')
+        self.assertEqual([e['text'] for e in self.store.archive_pending],
+                         ['item00', 'item01', 'item02', 'item03', 'item04'])
+
+    def test_evicted_entries_are_not_archived_by_default(self):
+        store = HistoryStore(os.path.join(self.tmp.name, 'history.json'),
+                             os.path.join(self.tmp.name, 'archive'))
+        store.history_byte_budget = 30
+        for i in range(10):
+            store.add(f'item{i:02d}')
+
+        self.assertEqual(len(store.get_history()), 5)
+        self.assertEqual(store.archive_pending, [])
+
+    def test_frequent_entry_survives_burst_of_new_copies(self):
+        self.store.history_byte_budget = 200
+        for _ in range(3):
+            self.store.add('keep me')
+        for i in range(200):
+            self.store.add(f'burst{i:03d}')
+
+        self.assertIn('keep me', self.store.entries_by_text)
+        self.assertLessEqual(self.store.history_bytes, 200)
+
+    def test_protected_entries_over_their_share_become_evictable(self):
+        self.store.history_byte_budget = 40
+        for i in range(4):
+            for _ in range(3):
+                self.store.add(f'hot{i:02d}')  # 5 байт, доля - 20 байт
+        self.store.add('hot04')
+        for _ in range(2):
+            self.store.add('hot04')
+        for i in range(20):
+            self.store.add(f'cold{i:02d}')
+
+        self.assertLessEqual(self.store.protected_bytes, 20)
+        self.assertNotIn('hot00', self.store.entries_by_text)
+        self.assertIn('hot04', self.store.entries_by_text)
+
+    def test_quick_paste_uses_promote_entry(self):
+        self.store.history_byte_budget = 30
+        self.store.add('pasted')
+        self.store.touch('pasted')
+        self.store.touch('pasted')
+        for i in range(10):
+            self.store.add(f'item{i:02d}')
+
+        self.assertIn('pasted', self.store.protected)
+        self.assertIn('pasted', self.store.entries_by_text)
+
+    def test_search_merges_live_history_and_archive(self):
+        self.store.history_byte_budget = 30
+        for i in range(10):
+            self.store.add(f'item{i:02d}')
+        self.flush()
+
+        archived = self.store.search_archive('item0')
+        first = self.store.search_history('item0', limit=6, archived=archived)
+        rest = self.store.search_history('item0', first['next_cursor'], limit=6, archived=archived)
+
+        self.assertEqual(first['total'], 10)
+        self.assertEqual(self.texts(first), [f'item{i:02d}' for i in range(9, 3, -1)])
+        self.assertEqual(self.texts(rest), ['item03', 'item02', 'item01', 'item00'])
+        self.assertIsNone(rest['next_cursor'])
+
+    def test_search_archive_pages_and_refinements_use_cache(self):
+        self.store.history_byte_budget = 30
+        for i in range(10):
+            self.store.add(f'item{i:02d}')
+        self.flush()
+        reads = []
+        read_segment = self.store.read_archive_segment
+        self.store.read_archive_segment = lambda name: reads.append(name) or read_segment(name)
+
+        first = self.store.search_archive('item')
+        scanned = len(reads)
+        self.store.search_archive('item')
+        refined = self.store.search_archive('item0')
+        narrowed = self.store.search_archive('item0', since=self.store.entry_key(first[1])[0])
+
+        self.assertEqual(len(reads), scanned)
+        self.assertEqual([e['text'] for e in refined], ['item04', 'item03', 'item02', 'item01', 'item00'])
+        self.assertEqual([e['text'] for e in narrowed], ['item04', 'item03'])
+
+        self.store.add('item10')
+        self.flush()
+        again = self.store.search_archive('item0')
+
+        self.assertGreater(len(reads), scanned)
+        self.assertEqual(again[0]['text'], 'item05')
+
+    def test_delete_hides_and_purges_archived_copies(self):
+        self.store.history_byte_budget = 30
+        for i in range(10):
+            self.store.add(f'item{i:02d}')
+        self.flush()
+        # Живая копия item02 поверх архивной
+        self.store.add('item02')
+
+        self.store.delete('item02')
+        self.store.delete('item00')  # Есть только в архиве
+        pending = self.store.search_history('item', limit=20, archived=self.store.search_archive('item'))
+        self.flush()
+        written = self.store.search_archive('item')
+
+        self.assertNotIn('item02', self.texts(pending))
+        self.assertNotIn('item00', self.texts(pending))
+        self.assertEqual(sorted(e['text'] for e in written), ['item01', 'item03', 'item04', 'item05'])
+
+    def test_deleted_at_is_forgotten_once_archive_is_purged(self):
+        self.store.history_byte_budget = 30
+        for i in range(10):
+            self.store.add(f'item{i:02d}')
+        self.flush()
+
+        self.store.delete('item00')
+        self.store.delete('item01')
+        changes = self.store.take_archive_changes()
+        self.store.delete('item01')  # Удалили снова, пока писали архив
+        self.store.forget_deleted(self.store.write_archive(changes))
+        archived = self.store.search_archive('item')
+
+        self.assertEqual(set(self.store.deleted_at), {'item01'})
+        self.assertEqual(sorted(e['text'] for e in archived), ['item02', 'item03', 'item04'])
+
+    def test_copy_after_delete_is_archived_again(self):
+        self.store.history_byte_budget = 12
+        self.store.add('secret')
+        self.store.delete('secret')
+        self.store.add('secret')
+        self.store.add('other1')
+        self.store.add('other2')  # Вытесняет новую копию secret
+        self.flush()
+
+        archived = self.store.search_archive('secret')
+        page = self.store.search_history('secret', archived=archived)
+
+        self.assertEqual(len(archived), 1)
+        self.assertEqual(self.texts(page), ['secret'])
+
+    def test_load_keeps_entries_captured_before_file_was_read(self):
+        self.store.add('captured')
+        self.store.toggle_pin('captured')
+
+        changed = self.store.load({
+            'history': [make_entry('from file', 5), make_entry('captured', 10)],
+            'pinned': [make_entry('pinned in file', 20)]
+        })
+
+        self.assertTrue(changed)
+        self.assertEqual([e['text'] for e in self.store.get_history()], ['captured', 'from file'])
+        self.assertEqual([e['text'] for e in self.store.pinned], ['pinned in file', 'captured'])
+
+    def test_load_does_not_age_out_existing_history_by_default(self):
+        old = [make_entry(f'old{i}', 60 * 24 * 400 + i) for i in range(4)]
+
+        changed = self.store.load({'history': old})
+
+        self.assertFalse(changed)
+        self.assertEqual(len(self.store.get_history()), 4)
+        self.assertEqual(self.store.archive_pending, [])
+
+    def test_age_limit_when_enabled(self):
+        self.store.max_entry_age_days = 30
+        self.store.load({'history': [make_entry('fresh', 5), make_entry('ancient', 60 * 24 * 400)]})
+
+        self.assertEqual([e['text'] for e in self.store.get_history()], ['fresh'])
+        self.assertEqual([e['text'] for e in self.store.archive_pending], ['ancient'])
+
+    def test_snapshot_keeps_only_settings_from_file(self):
+        self.store.load({'history': [], 'history_byte_budget': 1000})
+        self.store.max_entry_age_days = 7  # Умолчание, не из файла
+
+        data = self.store.snapshot()
+
+        self.assertEqual(data['history_byte_budget'], 1000)
+        self.assertNotIn('max_entry_age_days', data)
+        self.assertNotIn('archive_evicted', data)
+
+    def test_load_skips_defaults_written_by_old_versions(self):
+        self.store.load({'history': [], 'history_byte_budget': 1000, 'max_entry_age_days': 90,
+                         'protect_uses': 3, 'protected_share': 0.5, 'archive_evicted': True})
+
+        self.assertEqual(self.store.max_entry_age_days, 0)
+        self.assertEqual(self.store.file_settings, {'history_byte_budget'})
+
+    def test_clear_keeps_pinned_and_drops_archive(self):
+        self.store.history_byte_budget = 12
+        for i in range(4):
+            self.store.add(f'item{i:02d}')
+        self.store.toggle_pin('item03')
+        self.flush()
+
+        self.store.clear()
+        self.flush()
+
+        self.assertEqual(self.store.get_history(), [])
+        self.assertEqual([e['text'] for e in self.store.pinned], ['item03'])
+        self.assertEqual(self.store.search_archive('item'), [])
+
+    def test_clear_hides_archive_before_it_is_written(self):
+        self.store.history_byte_budget = 12
+        for i in range(4):
+            self.store.add(f'item{i:02d}')
+        self.flush()
+        self.store.search_archive('item')
+
+        self.store.clear()
+        cache = self.store.archive_cache
+        page = self.store.search_history('item', archived=self.store.search_archive('item'))
+
+        self.assertIsNone(cache)
+        self.assertEqual(page['items'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,15 @@ window.addEventListener('DOMContentLoaded', () => {
     loadHistory();
 });
 
-let lastHistoryLength = 0;
+const PAGE_SIZE = 30;  // Карточек за одну подгрузку
+
+let lastSignature = '';   // Что показано сейчас: всего записей, верхняя запись, закрепленные
+let nextCursor = null;    // Курсор следующей страницы (null - все показано)
+let loadingPage = false;
+let pinnedTexts = new Set();
+let slotCounter = 0;      // Номер слота Ctrl+Alt+N для следующей карточки
+let requestId = 0;        // Отбрасываем ответы, устаревшие до прихода
+let searchTimer = null;
 
 // Функции для управления видимостью из Python
 eel.expose(show_window);
@@ -18,46 +26,151 @@ function hide_window() {
     document.body.style.pointerEvents = 'none';
 }
 
-// Загрузка истории
-async function loadHistory() {
-    const history = await eel.get_history()();
+// Границы фильтра по времени [since, until) в unix-секундах
+function timeRange() {
+    const filter = document.getElementById('timeFilter').value;
+    const now = new Date();
+    const midnight = new Date(now.getFullYear(), now.getMonth(), now.getDate());
     
-    // Обновляем только если изменилось количество
-    if (history.length !== lastHistoryLength) {
-        lastHistoryLength = history.length;
-        renderHistory(history);
+    if (filter === 'hour') return [now.getTime() / 1000 - 3600, null];
+    if (filter === 'today') return [midnight.getTime() / 1000, null];
+    if (filter === 'yesterday') {
+        const yesterday = new Date(midnight);
+        yesterday.setDate(yesterday.getDate() - 1);
+        return [yesterday.getTime() / 1000, midnight.getTime() / 1000];
+    }
+    return [null, null];
+}
+
+// Текущий поисковый запрос (пусто - обычная история)
+function searchText() {
+    return document.getElementById('search').value.trim();
+}
+
+// Страница истории или результатов поиска (поиск заглядывает и в архив)
+function fetchPage(cursor) {
+    const [since, until] = timeRange();
+    const query = searchText();
+    if (query) {
+        return eel.search_history(query, cursor, PAGE_SIZE, since, until)();
+    }
+    return eel.query_history(cursor, PAGE_SIZE, since, until)();
+}
+
+// Список прокручен вниз от начала
+function scrolledDown() {
+    return document.getElementById('history').scrollTop > 0;
+}
+
+// Загрузка первой страницы истории.
+// quiet - фоновое обновление: пока список прокручен вниз, его не трогаем,
+// иначе пропадут подгруженные страницы и прокрутка
+async function loadHistory(quiet = false) {
+    if (quiet && scrolledDown()) return;
+    const id = ++requestId;
+    const page = await fetchPage(null);
+    // В поиске закрепленные не выделяем - они попадут в результаты как обычные
+    const pinned = searchText() ? [] : await eel.get_pinned()();
+    if (id !== requestId || (quiet && scrolledDown())) return;
+    
+    const signature = [
+        searchText(),
+        page.total,
+        page.items.length ? page.items[0].text : '',
+        pinned.map(entry => entry.text).join('\n')
+    ].join('\n');
+    
+    // Перерисовываем только если что-то изменилось
+    if (signature !== lastSignature) {
+        lastSignature = signature;
+        nextCursor = page.next_cursor;
+        renderHistory(page, pinned);
+    }
+}
+
+// Подгрузка следующей страницы при прокрутке
+async function loadMore() {
+    if (nextCursor === null || loadingPage) return;
+    loadingPage = true;
+    try {
+        const id = requestId;
+        const page = await fetchPage(nextCursor);
+        if (id !== requestId) return;
+        nextCursor = page.next_cursor;
+        appendHistoryCards(page.items);
+    } finally {
+        loadingPage = false;
+    }
+    maybeLoadMore();
+}
+
+// Догружаем, если до конца списка осталось меньше экрана
+function maybeLoadMore() {
+    const container = document.getElementById('history');
+    if (container.scrollTop + container.clientHeight * 2 >= container.scrollHeight) {
+        loadMore();
     }
 }
 
 // Отрисовка истории
-function renderHistory(history) {
+function renderHistory(page, pinned) {
     const container = document.getElementById('history');
     const empty = document.getElementById('empty');
     
     container.innerHTML = '';
+    document.getElementById('count').textContent =
+        searchText() ? `найдено ${page.total}` : `${page.total} зап.`;
     
-    if (!history || history.length === 0) {
+    if (page.items.length === 0 && pinned.length === 0) {
         empty.classList.add('show');
         return;
     }
     
     empty.classList.remove('show');
     
-    history.forEach(entry => {
-        const card = createCard(entry);
+    // Закрепленные - сверху, номер слота = Ctrl+Alt+N
+    pinnedTexts = new Set(pinned.map(entry => entry.text));
+    slotCounter = pinned.length;
+    
+    pinned.forEach(entry => {
+        container.appendChild(createCard(entry, true, entry.slot));
+    });
+    
+    appendHistoryCards(page.items);
+    maybeLoadMore();
+}
+
+// Добавление карточек страницы истории
+function appendHistoryCards(items) {
+    const container = document.getElementById('history');
+    
+    items.forEach(entry => {
+        if (pinnedTexts.has(entry.text)) return;
+        slotCounter++;
+        // Номера слотов совпадают с историей только без фильтра по времени
+        const showSlot = slotCounter <= 9 && !searchText() &&
+            document.getElementById('timeFilter').value === 'all';
+        const card = createCard(entry, false, showSlot ? slotCounter : null);
         container.appendChild(card);
     });
 }
 
 // Создание карточки
-function createCard(entry) {
+function createCard(entry, pinned, slot) {
     const card = document.createElement('div');
-    card.className = 'card';
+    card.className = pinned ? 'card card-pinned' : 'card';
     
     const text = document.createElement('div');
     text.className = 'card-text';
     text.textContent = entry.text;
     
+    if (slot) {
+        const badge = document.createElement('span');
+        badge.className = 'card-slot';
+        badge.textContent = slot;
+        text.prepend(badge);
+    }
+    
     const actions = document.createElement('div');
     actions.className = 'card-actions';
     
@@ -69,15 +182,29 @@ function createCard(entry) {
         copyToClipboard(entry.text);
     };
     
+    const pinBtn = document.createElement('button');
+    pinBtn.className = pinned ? 'btn btn-pin active' : 'btn btn-pin';
+    pinBtn.textContent = pinned ? '📌' : '📍';
+    pinBtn.onclick = (e) => {
+        e.stopPropagation();
+        togglePin(entry.text);
+    };
+    
     const deleteBtn = document.createElement('button');
     deleteBtn.className = 'btn btn-delete';
     deleteBtn.textContent = '🗑️';
     deleteBtn.onclick = (e) => {
         e.stopPropagation();
-        deleteEntry(entry.text);
+        // Удаление закрепленной карточки = открепление
+        if (pinned) {
+            togglePin(entry.text);
+        } else {
+            deleteEntry(entry.text);
+        }
     };
     
     actions.appendChild(copyBtn);
+    actions.appendChild(pinBtn);
     actions.appendChild(deleteBtn);
     
     card.appendChild(text);
@@ -100,11 +227,44 @@ async function deleteEntry(text) {
     loadHistory();
 }
 
-// Очистка всей истории
+// Закрепление/открепление записи
+async function togglePin(text) {
+    await eel.toggle_pin(text)();
+    loadHistory();
+}
+
+// Очистка всей истории (закрепленные остаются)
 document.getElementById('clearBtn').addEventListener('click', async () => {
     await eel.clear_history()();
     loadHistory();
 });
 
-// Проверяем изменения каждые 2 секунды (не перерисовываем если не изменилось)
-setInterval(loadHistory, 2000);
+// Смена фильтра по времени
+document.getElementById('timeFilter').addEventListener('change', () => {
+    lastSignature = '';
+    document.getElementById('history').scrollTop = 0;
+    loadHistory();
+});
+
+// Поиск - после паузы в наборе, чтобы не читать архив на каждую букву
+document.getElementById('search').addEventListener('input', () => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+        lastSignature = '';
+        document.getElementById('history').scrollTop = 0;
+        loadHistory();
+    }, 250);
+});
+
+// Ленивая подгрузка при прокрутке
+document.getElementById('history').addEventListener('scroll', () => {
+    maybeLoadMore();
+    // Вернулись наверх - сразу показываем то, что опрос пропустил
+    if (!scrolledDown() && !searchText()) loadHistory(true);
+});
+
+// Проверяем изменения каждые 2 секунды (не перерисовываем если не изменилось).
+// Во время поиска не опрашиваем - результаты обновятся при изменении запроса
+setInterval(() => {
+    if (!searchText()) loadHistory(true);
+}, 2000);